@@ -1,8 +1,12 @@
+import asyncio
+from aiolimiter import AsyncLimiter
+from collections import defaultdict
 from datetime import datetime
 from enum import Enum
-import requests
-from openai import OpenAI
-import time
+from diskcache import Cache
+import httpx
+import orjson
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 import os
 
@@ -14,6 +18,8 @@ SOLSCAN_API_KEY = os.getenv("SOLSCAN_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 TOP_N = os.getenv("TOP_N")
+CACHE_DIR = os.getenv("CACHE_DIR", "/tmp/solscan")
+CACHE_TTL = os.getenv("CACHE_TTL")
 
 if not SOLSCAN_API_KEY:
     raise ValueError(
@@ -25,6 +31,20 @@ if TOP_N:
     TOP_N = int(TOP_N)
 else:
     TOP_N = 10
+if CACHE_TTL:
+    CACHE_TTL = int(CACHE_TTL)
+else:
+    CACHE_TTL = 300
+
+# persistent cache of summaries, shared across invocations and cold starts
+cache = Cache(CACHE_DIR)
+
+# program/DEX vault addresses whose other token holdings are not worth fetching,
+# extendable with a comma-separated KNOWN_VAULTS environment variable
+KNOWN_VAULTS = frozenset([
+    "5Q544fKrFoe6tsEbD7S8EmxGTJYAKtTVhAW5Q5pge4j1",  # Raydium Authority V4
+    *(a.strip() for a in os.getenv("KNOWN_VAULTS", "").split(",") if a.strip())
+])
 
 
 class ValidTopN(Enum):
@@ -34,10 +54,13 @@ class ValidTopN(Enum):
     FORTY = 40
 
 
+_VALID_TOP_N = frozenset(item.value for item in ValidTopN)
+
+
 def validate_top_n(top_n: int):
-    if top_n not in [item.value for item in ValidTopN]:
-        raise ValueError(f"Invalid topN value: {top_n}. Allowed values are {
-                         [item.value for item in ValidTopN]}.")
+    if top_n not in _VALID_TOP_N:
+        raise ValueError(
+            f"Invalid topN value: {top_n}. Allowed values are {sorted(_VALID_TOP_N)}.")
 
 
 def validate_token_address(token_address: str):
@@ -49,32 +72,66 @@ def validate_token_address(token_address: str):
         raise ValueError("tokenAddress must be 44 characters long.")
 
 
+def _json(response):
+    # parse the raw body with orjson, skipping charset detection and stdlib json
+    return orjson.loads(response.content)
+
+
 class SolanaTokenAnalyzer:
-    def __init__(self, token_address: str, top_n: int = 10):
+    def __init__(self, token_address: str, top_n: int = 10, max_concurrency: int = 20,
+                 max_rate: int = 20):
         self.token_address = token_address
         self.top_n = top_n
         self.api_url = "https://pro-api.solscan.io/v2.0"
         self.headers = {"accept": "application/json", "token": SOLSCAN_API_KEY}
 
-    def get_top_holders(self):
+        # one shared HTTP/2 client so concurrent calls are multiplexed over a single connection
+        self.client = httpx.AsyncClient(
+            http2=True,
+            headers=self.headers,
+            timeout=30,
+            limits=httpx.Limits(max_connections=40, max_keepalive_connections=20))
+        # bound the number of in-flight requests to respect solscan rate limits
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        # cap the global request rate (requests per second) without blocking the event loop
+        self.rate_limiter = AsyncLimiter(max_rate, time_period=1.0)
+        # token metadata is shared by many holders (USDC, SOL, ...), fetch each once
+        self._token_details_cache = {}
+        self._token_details_locks = defaultdict(asyncio.Lock)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def _get(self, url: str, params: dict):
+        async with self.semaphore, self.rate_limiter:
+            response = await self.client.get(url, params=params)
+        response.raise_for_status()
+        return response
+
+    async def get_top_holders(self):
         url = f"{self.api_url}/token/holders"
         params = {"address": self.token_address, "page_size": self.top_n}
 
-        response = requests.get(url, params=params, headers=self.headers)
-        response.raise_for_status()
-        return response.json()["data"]["items"]
+        response = await self._get(url, params)
+        return _json(response)["data"]["items"]
 
-    def get_first_activity_date(self, wallet_address: str):
+    async def get_first_activity_date(self, wallet_address: str):
         url = f"{self.api_url}/account/balance_change"
         params = {"address": wallet_address, "token": self.token_address,
                   "sort_by": "block_time", "sort_order": "asc", "remove_spam": "true"}
-        response = requests.get(url, params=params, headers=self.headers)
-        response.raise_for_status()
-        data = response.json()["data"]
+        response = await self._get(url, params)
+        data = _json(response)["data"]
         return None if len(data) == 0 else data[0]["time"]
 
-    def get_transactions(self, wallet_address: str):
-        transactions = []
+    async def get_change_types(self, wallet_address: str):
+        # counts are reported as "more than 100" past 100, so a single page is enough
+        # only the change type ("inc"/"dec") of each balance change is needed for the counts
         url = f"{self.api_url}/account/balance_change"
         params = {
             "address": wallet_address,
@@ -82,47 +139,26 @@ class SolanaTokenAnalyzer:
             "sort_by": "block_time",
             "sort_order": "desc",
             "remove_spam": "true",
-            "page_size": 40,
+            "page_size": 100,
             "page": 1
         }
+        response = await self._get(url, params)
 
-        while True:
-            response = requests.get(url, params=params, headers=self.headers)
-            response.raise_for_status()
-
-            data = response.json()["data"]
-            new_transactions = [
-                {
-                    "trans_id": tx.get("trans_id"),
-                    "fee": tx.get("fee"),
-                    "amount": tx.get("amount"),
-                    "time": tx.get("time"),
-                    "change_type": tx.get("change_type")
-                }
-                for tx in data
-            ]
-            transactions.extend(new_transactions)
-
-            if len(data) < 40 or len(transactions) >= 100:
-                break
-
-            params["page"] += 1
-            time.sleep(0.05)
-
-        return transactions
+        data = _json(response)["data"]
+        return [tx.get("change_type") for tx in data]
 
+    @staticmethod
     def determine_holder_type(number_of_transactions, number_of_out_transactions):
         if number_of_transactions == 0 or number_of_out_transactions / number_of_transactions < 0.1:
             return "Long-term holder"
         return "Frequent flipper"
 
-    def analyze_holder(self, transactions: list):
-        number_of_transactions = len(transactions)
-        number_of_in_transactions = sum(
-            1 for tx in transactions if tx["change_type"] == "inc")
+    def analyze_holder(self, change_types: list):
+        number_of_transactions = len(change_types)
+        number_of_in_transactions = change_types.count("inc")
         number_of_out_transactions = number_of_transactions - number_of_in_transactions
 
-        type_of_holder = SolanaTokenAnalyzer.determine_holder_type(
+        type_of_holder = self.determine_holder_type(
             number_of_transactions, number_of_out_transactions)
 
         def format_count(count):
@@ -135,13 +171,19 @@ class SolanaTokenAnalyzer:
             "type_of_holder": type_of_holder
         }
 
-    def get_token_details(self, token_address: str):
+    async def get_token_details(self, token_address: str):
+        async with self._token_details_locks[token_address]:
+            if token_address not in self._token_details_cache:
+                self._token_details_cache[token_address] = await self._fetch_token_details(
+                    token_address)
+        return self._token_details_cache[token_address]
+
+    async def _fetch_token_details(self, token_address: str):
         url = f"{self.api_url}/token/meta"
         params = {"address": token_address}
-        response = requests.get(url, params=params, headers=self.headers)
+        response = await self._get(url, params)
 
-        response.raise_for_status()
-        data = response.json()["data"]
+        data = _json(response)["data"]
 
         return {
             "name": data.get("name"),
@@ -153,46 +195,55 @@ class SolanaTokenAnalyzer:
             "supply": data.get("supply")
         }
 
-    def get_other_tokens(self, wallet_address: str):
+    async def get_other_tokens(self, wallet_address: str):
         url = f"{self.api_url}/account/token-accounts"
         params = {"address": wallet_address, "type": "token",
                   "page_size": 40, "hide_zero": True}
 
-        response = requests.get(url, params=params, headers=self.headers)
-        response.raise_for_status()
+        response = await self._get(url, params)
 
-        data = response.json()["data"]
-        tokens = []
-        for item in data:
-            token_details = self.get_token_details(item["token_address"])
+        data = _json(response)["data"]
+        details_list = await asyncio.gather(
+            *[self.get_token_details(item["token_address"]) for item in data])
 
-            tokens.append({
+        return [
+            {
                 "amount": item["amount"],
                 "token_decimals": item["token_decimals"],
                 **token_details
-            })
-
-        return tokens
+            }
+            for item, token_details in zip(data, details_list)
+        ]
 
-    def analyze(self):
-        top_holders = self.get_top_holders()
-        token = self.get_token_details(self.token_address)
-        analysis = []
+    async def analyze(self):
+        top_holders, token = await asyncio.gather(
+            self.get_top_holders(), self.get_token_details(self.token_address))
 
-        for holder in top_holders:
+        async def process_holder(holder):
             wallet_address = holder["address"]
-            transactions = self.get_transactions(wallet_address)
-            holder_details = self.analyze_holder(transactions)
-            other_tokens = self.get_other_tokens(wallet_address)
-            analysis.append({
+            # skip the token-meta cascade for empty balances and known vaults
+            if wallet_address in KNOWN_VAULTS or ("amount" in holder and holder["amount"] == 0):
+                change_types, first_activity_date = await asyncio.gather(
+                    self.get_change_types(wallet_address),
+                    self.get_first_activity_date(wallet_address))
+                other_tokens = []
+            else:
+                change_types, other_tokens, first_activity_date = await asyncio.gather(
+                    self.get_change_types(wallet_address),
+                    self.get_other_tokens(wallet_address),
+                    self.get_first_activity_date(wallet_address))
+            holder_details = self.analyze_holder(change_types)
+            return {
                 "wallet_address": wallet_address,
                 "token_balance": holder.get("amount"),
                 "rank": holder["rank"],
-                "first_activity_date": self.get_first_activity_date(wallet_address),
+                "first_activity_date": first_activity_date,
                 "other_tokens": other_tokens,
-                "holder_details": holder_details,
-                "transactions": transactions
-            })
+                "holder_details": holder_details
+            }
+
+        analysis = await asyncio.gather(
+            *[process_holder(holder) for holder in top_holders])
 
         return {
             "token": token,
@@ -201,8 +252,39 @@ class SolanaTokenAnalyzer:
         }
 
 
-def summarize_results(results):
-    # ignore transactions because they are not needed for summarization
+async def summarize_holder(client, semaphore, token, holder, date, queue):
+    # compact JSON is cheaper to build than repr() and costs fewer prompt tokens
+    payload = orjson.dumps({"token": token, "holder": holder, "date": date}).decode()
+
+    try:
+        async with semaphore:
+            stream = await client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": "You are a helpful assistant that summarizes blockchain analysis results."},
+                    {"role": "user", "content": f"Summarize the following blockchain analysis data of a single token holder in a human-readable form:\n\n{payload}"}
+                ],
+                temperature=0.7,
+                max_tokens=80,
+                stream=True,
+            )
+            started = False
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content or ""
+                # drop the model's leading whitespace, up to the first non-empty delta
+                if not started:
+                    content = content.lstrip()
+                    started = bool(content)
+                if content:
+                    queue.put_nowait(content)
+    finally:
+        # signal the end of this holder's summary, even on failure
+        queue.put_nowait(None)
+
+
+async def summarize_results(results, max_concurrency: int = 10):
     token = results.get("token")
     analysis = [
         {
@@ -217,37 +299,71 @@ def summarize_results(results):
     ]
     date = results.get("date")
 
-    client = OpenAI(
+    client = AsyncOpenAI(
         api_key=OPENAI_API_KEY
     )
-    analysis_str = f"Token: {token}\nAnalysis Data: {str(analysis)}\nDate of Analysis: {date}"
-
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant that summarizes blockchain analysis results."},
-            {"role": "user", "content": f"Summarize the following blockchain analysis data in a human-readable form:\n\n{analysis_str}"}
-        ],
-        temperature=0.7,
-        max_tokens=200,
-    )
-    return response.get("choices")[0].get("message").get("content").strip()
-
+    # one short summary per holder, generated concurrently within openai rate limits;
+    # chunks are yielded in rank order while later holders keep generating in the background
+    semaphore = asyncio.Semaphore(max_concurrency)
+    queues = [asyncio.Queue() for _ in analysis]
+    tasks = [
+        asyncio.create_task(summarize_holder(client, semaphore, token, holder, date, queue))
+        for holder, queue in zip(analysis, queues)
+    ]
 
-def main(request, store):
+    try:
+        yield f"Token: {token.get('name')} ({token.get('symbol')})\nDate of Analysis: {date}"
+        for holder, queue, task in zip(analysis, queues, tasks):
+            yield f"\n\n#{holder['rank']} {holder['wallet_address']}: "
+            # hold back trailing whitespace until more text follows, dropping it at the end
+            pending = ""
+            while (content := await queue.get()) is not None:
+                text = pending + content
+                stripped = text.rstrip()
+                pending = text[len(stripped):]
+                if stripped:
+                    yield stripped
+            # re-raise any error from this holder's completion
+            await task
+    finally:
+        for task in tasks:
+            task.cancel()
+        # retrieve errors from cancelled or already failed tasks so none go unobserved
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def store_summary(store, key, summary):
+    # diskcache drops expired entries itself; other mappings keep them until the caller evicts
+    if isinstance(store, Cache):
+        store.set(key, summary, expire=CACHE_TTL)
+    else:
+        store[key] = summary
+
+
+async def main(request, store=cache):
     validate_top_n(TOP_N)
     validate_token_address(request["tokenAddress"])
-    
-    key = f"analysis-{request['tokenAddress']}"
-    if key in store:
-        return store[key]
 
-    analyzer = SolanaTokenAnalyzer(
-        token_address=request["tokenAddress"], top_n=TOP_N)
-    results = analyzer.analyze()
-    
-    store[key] = summarize_results(results)
-    return store[key]
+    key = f"analysis-{request['tokenAddress']}:{TOP_N}"
+    # single lookup: a diskcache entry can expire between a membership check and a read
+    try:
+        summary = store[key]
+    except KeyError:
+        pass
+    else:
+        yield summary
+        return
+
+    async with SolanaTokenAnalyzer(
+            token_address=request["tokenAddress"], top_n=TOP_N) as analyzer:
+        results = await analyzer.analyze()
+
+    # stream the summary to the caller as it is generated, caching it once complete
+    chunks = []
+    async for chunk in summarize_results(results):
+        chunks.append(chunk)
+        yield chunk
+    store_summary(store, key, "".join(chunks))
 
 
 if __name__ == "__main__":
@@ -257,8 +373,12 @@ if __name__ == "__main__":
     validate_top_n(TOP_N)
     validate_token_address(request["tokenAddress"])
 
-    analyzer = SolanaTokenAnalyzer(
-        token_address=request["tokenAddress"], top_n=TOP_N)
-    results = analyzer.analyze()
+    async def run():
+        async with SolanaTokenAnalyzer(
+                token_address=request["tokenAddress"], top_n=TOP_N) as analyzer:
+            results = await analyzer.analyze()
+        async for chunk in summarize_results(results):
+            print(chunk, end="", flush=True)
+        print()
 
-    print(summarize_results(results))
+    asyncio.run(run())